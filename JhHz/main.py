@@ -9,11 +9,66 @@ import threading
 import json
 from pathlib import Path
 from queue import Queue
-import ctypes
 import traceback
+import tempfile
+import signal
 import importlib.util
+import re
+import time
+import bisect
+import base64
+import hashlib
+import mmap
+import importlib.metadata
+import multiprocessing
+import gzip
+import http.client
+import urllib.request
+import urllib.parse
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from multiprocessing.connection import Listener, Client, AuthenticationError
 
-mutex = None  # 全局变量，保证互斥锁存活
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+try:
+    from packaging.version import Version, InvalidVersion
+except ImportError:
+    try:
+        from pip._vendor.packaging.version import Version, InvalidVersion
+    except ImportError:
+        Version = InvalidVersion = None
+
+mutex = None  # 全局变量，保证单实例锁文件句柄存活
+
+def _env_int(name, default):
+    """读取整数环境变量，格式错误时使用默认值"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+# 包索引配置，可通过环境变量指向本地镜像（http://127.0.0.1:8080/simple/ 或 file:///D:/simple/）
+INDEX_URL = os.environ.get("JHHZ_INDEX_URL", "https://pypi.org/simple/")
+CACHE_DIR = Path(os.environ.get("JHHZ_CACHE_DIR", str(Path.home() / ".jhhz")))
+INDEX_CACHE_TTL = _env_int("JHHZ_INDEX_TTL", 6 * 3600)  # 秒
+INDEX_MAX_WORKERS = 16
+
+# 包列表流式加载的批量大小与最长间隔（秒）
+PACKAGE_BATCH_SIZE = 200
+PACKAGE_BATCH_INTERVAL = 0.05
+DETAILS_WORKERS = min(8, os.cpu_count() or 4)
+
+# 单实例锁与本地扫描服务地址（按用户区分）
+LOCK_PATH = CACHE_DIR / "jhhz.lock"
+SERVICE_KEY_PATH = CACHE_DIR / "jhhz.key"
+if os.name == 'nt':
+    SERVICE_ADDRESS = r"\\.\pipe\JhHzPythonManager-" + os.environ.get("USERNAME", "")
+else:
+    SERVICE_ADDRESS = str(CACHE_DIR / "jhhz.sock")
 
 def log_crash(exc_type, exc_value, exc_traceback):
     with open("crash.log", "a", encoding="utf-8") as f:
@@ -22,12 +77,23 @@ def log_crash(exc_type, exc_value, exc_traceback):
 sys.excepthook = log_crash
 
 def is_already_running():
+    """尝试获取单实例锁文件，已被其他实例持有时返回True
+
+    锁由操作系统在进程退出（包括崩溃）时自动释放，不会残留。
+    """
     global mutex
-    mutex_name = "Global\\JhHzPythonManager"  # 全局作用域
-    mutex = ctypes.windll.kernel32.CreateMutexW(None, False, mutex_name)
-    last_error = ctypes.windll.kernel32.GetLastError()
-    if last_error == 183:  # ERROR_ALREADY_EXISTS
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    lock_file = open(LOCK_PATH, "a+")
+    try:
+        if os.name == 'nt':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
         return True
+    mutex = lock_file
     return False
 
 def get_pip_path():
@@ -80,9 +146,685 @@ def get_package_size(path):
     except Exception:
         return "未知"
 
+def get_package_location(package_name):
+    """通过 pip show 获取包的安装位置(Windows优化)"""
+    try:
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            startupinfo.wShowWindow = subprocess.SW_HIDE
+
+        result = subprocess.run(
+            [sys.executable, "-m", "pip", "show", package_name],
+            capture_output=True, text=True, timeout=15, encoding='utf-8', errors='ignore',
+            startupinfo=startupinfo
+        )
+        
+        if result.returncode == 0:
+            for line in result.stdout.splitlines():
+                if line.startswith('Location:'):
+                    location = line.split(':', 1)[1].strip()
+                    return str(Path(location).resolve())
+        return "未知"
+    except Exception:
+        return "未知"
+
+def iter_installed_packages(path=None):
+    """逐个产出已安装的包 (name, version)，无需等待完整列表
+
+    直接扫描 sys.path（或指定的 path 列表）中的 dist-info/egg-info；打包后
+    的程序无法据此反映目标环境，改为逐行解析 pip list --format=freeze 的输出。
+    """
+    if path is None and getattr(sys, 'frozen', False):
+        yield from _iter_pip_freeze()
+        return
+    if path is None:
+        distributions = importlib.metadata.distributions()
+    else:
+        distributions = importlib.metadata.distributions(path=path)
+    seen = set()
+    for dist in distributions:
+        metadata = dist.metadata
+        name = metadata["Name"]
+        if not name:
+            continue
+        # 与pip一致，同名包以sys.path中靠前的为准
+        key = normalize_name(name)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield name, metadata["Version"]
+
+def _iter_pip_freeze(timeout=30, cmd=None):
+    if cmd is None:
+        pip_path = get_pip_path()
+        if pip_path:
+            cmd = [pip_path, "list", "--format=freeze"]
+        else:
+            # fallback
+            cmd = [sys.executable, "-m", "pip", "list", "--format=freeze"]
+    # stderr写入临时文件，避免其管道写满后与stdout互相阻塞
+    with tempfile.TemporaryFile(mode="w+", encoding='utf-8', errors='ignore') as stderr_file:
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file,
+                              text=True, encoding='utf-8', errors='ignore',
+                              start_new_session=os.name != 'nt') as proc:
+            def kill():
+                # 连同子进程一起结束，确保stdout能读到结束
+                if os.name == 'nt':
+                    proc.kill()
+                else:
+                    try:
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+
+            # 超时后结束pip进程，stdout随之结束
+            watchdog = threading.Timer(timeout, kill)
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                for line in proc.stdout:
+                    name, sep, version = line.strip().partition("==")
+                    if sep:
+                        yield name, version
+                returncode = proc.wait()
+            finally:
+                timed_out = not watchdog.is_alive()
+                watchdog.cancel()
+                if proc.poll() is None:
+                    kill()
+        if timed_out:
+            raise RuntimeError(f"pip list 超过 {timeout} 秒未完成")
+        if returncode != 0:
+            stderr_file.seek(0)
+            raise RuntimeError(stderr_file.read())
+
+def get_package_details(package_name):
+    """返回包的(安装位置, 大小)"""
+    location = get_package_location(package_name)
+    real_path = get_package_real_path(package_name)
+    size = get_package_size(real_path) if real_path else "未知"
+    return location, size
+
+def scan_inventory():
+    """不启动界面，直接扫描当前环境的包清单"""
+    packages = sorted(({"name": name, "version": version} for name, version in iter_installed_packages()),
+                      key=lambda x: x['name'].lower())
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+        details = executor.map(get_package_details, [p['name'] for p in packages])
+        for package, (location, size) in zip(packages, details):
+            package.update(location=location, size=size)
+    return packages
+
+def normalize_name(name):
+    """按PEP 503规范化包名"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def parse_version(version):
+    """返回可比较的版本对象，无法解析时返回None"""
+    if Version is not None:
+        try:
+            return Version(version)
+        except InvalidVersion:
+            return None
+    # 没有packaging时退化为数字元组比较
+    parts = re.match(r"^\d+(\.\d+)*$", version or "")
+    return tuple(int(p) for p in version.split(".")) if parts else None
+
+def is_prerelease(version):
+    if Version is not None:
+        return version.is_prerelease
+    return False
+
+def version_from_filename(filename, project):
+    """从wheel/sdist文件名中提取版本号"""
+    if filename.endswith(".whl"):
+        parts = filename[:-4].split("-")
+        return parts[1] if len(parts) >= 5 else None
+    for ext in (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".zip"):
+        if filename.endswith(ext):
+            stem = filename[:-len(ext)]
+            break
+    else:
+        return None
+    # sdist的包名本身可能包含'-'，按规范化后的包名匹配分隔位置
+    target = normalize_name(project)
+    for i, ch in enumerate(stem):
+        if ch == "-" and normalize_name(stem[:i]) == target:
+            return stem[i + 1:]
+    return stem.rsplit("-", 1)[1] if "-" in stem else None
+
+class _SimpleIndexParser(HTMLParser):
+    """解析PEP 503 HTML页面中的文件链接"""
+    def __init__(self):
+        super().__init__()
+        self.files = []
+        self._current = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            attrs = dict(attrs)
+            self._current = {"yanked": "data-yanked" in attrs, "text": ""}
+
+    def handle_data(self, data):
+        if self._current is not None:
+            self._current["text"] += data
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._current is not None:
+            self.files.append({"filename": self._current["text"].strip(),
+                               "yanked": self._current["yanked"]})
+            self._current = None
+
+class IndexClient:
+    """并发查询简单索引(PEP 503/691)的最新版本
+
+    - 每个工作线程按主机复用HTTP连接
+    - 使用ETag/Last-Modified进行条件请求
+    - 结果在磁盘上按TTL缓存，重复检查基本不访问网络
+    """
+    def __init__(self, index_url=INDEX_URL, cache_path=None, ttl=INDEX_CACHE_TTL,
+                 max_workers=INDEX_MAX_WORKERS):
+        if "://" not in index_url:
+            index_url = Path(index_url).resolve().as_uri()
+        self.index_url = index_url.rstrip("/") + "/"
+        self.cache_path = Path(cache_path) if cache_path else CACHE_DIR / "index_cache.json"
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache = self._load_cache()
+        # 遵循 HTTP(S)_PROXY / NO_PROXY 环境变量
+        self._proxies = urllib.request.getproxies()
+        # 本次检查中查询失败的包数量及最后一次错误，供界面日志使用
+        self.failures = 0
+        self.last_error = None
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # 索引地址变化后旧缓存作废
+            if data.get("index_url") == self.index_url:
+                return data.get("projects", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def save_cache(self):
+        with self._lock:
+            data = {"index_url": self.index_url, "projects": dict(self._cache)}
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+
+    def _get_connection(self, scheme, netloc, fresh=False):
+        """获取当前线程针对某主机的持久连接"""
+        pool = getattr(self._local, "connections", None)
+        if pool is None:
+            pool = self._local.connections = {}
+        key = (scheme, netloc)
+        conn = pool.get(key)
+        if conn is None or fresh:
+            if conn is not None:
+                conn.close()
+            proxy = self._proxy_for(scheme, netloc)
+            if proxy is None:
+                conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+                conn = conn_cls(netloc, timeout=15)
+            else:
+                proxy_cls = http.client.HTTPSConnection if proxy.scheme == "https" else http.client.HTTPConnection
+                conn = proxy_cls(proxy.hostname, proxy.port, timeout=15)
+                if scheme == "https":
+                    # 通过 CONNECT 隧道访问 https 索引
+                    conn.set_tunnel(netloc, headers=self._proxy_headers(proxy))
+            pool[key] = conn
+        return conn
+
+    def _proxy_for(self, scheme, netloc):
+        """返回访问该主机应使用的代理地址，不走代理时返回None"""
+        proxy = self._proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass(netloc.rsplit(":", 1)[0]):
+            return None
+        return urllib.parse.urlsplit(proxy if "://" in proxy else "http://" + proxy)
+
+    @staticmethod
+    def _proxy_headers(proxy):
+        if not proxy.username:
+            return {}
+        credentials = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+        return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials.encode()).decode("ascii")}
+
+    def _http_get(self, url, headers, redirects=3):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        proxy = self._proxy_for(parts.scheme, parts.netloc)
+        if proxy is not None and parts.scheme == "http":
+            # 经 http 代理转发时请求行使用完整URL
+            path = url
+            headers = dict(headers, **self._proxy_headers(proxy))
+        for attempt in range(2):
+            conn = self._get_connection(parts.scheme, parts.netloc, fresh=attempt > 0)
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # 服务端关闭了空闲连接时重建一次
+                if attempt:
+                    raise
+        if response.status in (301, 302, 303, 307, 308) and redirects:
+            location = urllib.parse.urljoin(url, response.getheader("Location", ""))
+            return self._http_get(location, headers, redirects - 1)
+        if response.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return response.status, response.getheader, body
+
+    def _fetch(self, name, entry):
+        """请求项目页面，返回(status, 新的缓存字段, 页面内容, 内容类型)"""
+        url = self.index_url + normalize_name(name) + "/"
+        scheme = urllib.parse.urlsplit(url).scheme
+        if scheme in ("http", "https"):
+            headers = {
+                "Accept": "application/vnd.pypi.simple.v1+json, text/html;q=0.1",
+                "Accept-Encoding": "gzip",
+                "User-Agent": "JhHz",
+            }
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            status, getheader, body = self._http_get(url, headers)
+            validators = {"etag": getheader("ETag"), "last_modified": getheader("Last-Modified")}
+            return status, validators, body, getheader("Content-Type") or ""
+        # 本地目录形式的索引，以修改时间作为校验字段
+        try:
+            local_path = Path(urllib.request.url2pathname(urllib.parse.urlsplit(url).path))
+            index_file = local_path / "index.html"
+            if not index_file.exists():
+                index_file = local_path / "index.json"
+            stat = index_file.stat()
+        except OSError:
+            return 404, {}, b"", ""
+        validators = {"etag": None, "last_modified": str(stat.st_mtime_ns)}
+        if entry.get("last_modified") == validators["last_modified"]:
+            return 304, validators, b"", ""
+        content_type = "application/json" if index_file.suffix == ".json" else "text/html"
+        return 200, validators, index_file.read_bytes(), content_type
+
+    @staticmethod
+    def _pick_latest(name, body, content_type):
+        if "json" in content_type:
+            files = json.loads(body.decode("utf-8")).get("files", [])
+            files = [{"filename": f.get("filename", ""), "yanked": bool(f.get("yanked"))}
+                     for f in files]
+        else:
+            parser = _SimpleIndexParser()
+            parser.feed(body.decode("utf-8", errors="ignore"))
+            files = parser.files
+        latest = None
+        for f in files:
+            if f["yanked"]:
+                continue
+            raw = version_from_filename(f["filename"], name)
+            parsed = parse_version(raw) if raw else None
+            if parsed is None or is_prerelease(parsed):
+                continue
+            if latest is None or parsed > latest[0]:
+                latest = (parsed, raw)
+        return latest[1] if latest else None
+
+    def get_latest(self, name):
+        """返回包在索引中的最新稳定版本，查询失败返回None"""
+        key = normalize_name(name)
+        with self._lock:
+            entry = dict(self._cache.get(key, {}))
+        if entry and time.time() - entry.get("checked", 0) < self.ttl:
+            return entry.get("latest")
+        try:
+            status, validators, body, content_type = self._fetch(name, entry)
+            # 304响应可能不带校验字段，沿用旧值
+            validators = {k: v or entry.get(k) for k, v in validators.items()}
+            if status == 304 and entry:
+                latest = entry.get("latest")
+            elif status == 200:
+                latest = self._pick_latest(name, body, content_type)
+            elif status == 404:
+                latest = None
+            else:
+                # 5xx/429等临时错误不写入缓存，下次检查时重试
+                self._record_failure(f"{name}: HTTP {status}")
+                return entry.get("latest")
+        except Exception as e:
+            self._record_failure(f"{name}: {e}")
+            return entry.get("latest")
+        with self._lock:
+            self._cache[key] = dict(validators, latest=latest, checked=time.time())
+        return latest
+
+    def _record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+
+    def iter_latest(self, names):
+        """并发查询，按完成顺序产出(name, latest)"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.get_latest, name): name for name in names}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        self.save_cache()
+
+def _hash_file(job):
+    """在工作进程中计算文件摘要，使用内存映射避免整文件读入"""
+    path, algorithm = job
+    try:
+        digest = hashlib.new(algorithm)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest.update(mapped)
+    except (OSError, ValueError):
+        # 文件读取失败、在 fstat 与 mmap 之间被截断为空等情况，视为无法校验
+        return None
+    return base64.urlsafe_b64encode(digest.digest()).rstrip(b"=").decode("ascii")
+
+class RecordVerifier:
+    """按各发行版 RECORD 中记录的哈希和大小校验已安装文件
+
+    - 哈希在进程池中并行计算
+    - 按 (inode, 大小, 修改时间) 缓存摘要，未变化的文件不再重复计算
+    """
+    def __init__(self, cache_path=None, max_workers=None):
+        self.cache_path = Path(cache_path) if cache_path else CACHE_DIR / "verify_cache.json"
+        self.max_workers = max_workers or os.cpu_count() or 4
+        self._cache = self._load_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._cache, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _collect(distributions):
+        """展开所有 RECORD 条目，返回(各包结果, 待校验条目, 已被任意包声明的路径集合)
+
+        没有 RECORD 的旧式 egg-info 包只标记为未校验：其 SOURCES.txt 等文件
+        中的路径相对于源码树，无法用于校验，但仍计入已声明路径。
+        """
+        results = {}
+        entries = []
+        claimed = set()
+        seen = set()
+        for dist in distributions:
+            name = dist.metadata["Name"]
+            # 与 iter_installed_packages 一致，同名包只校验 sys.path 中靠前的一份
+            if not name or normalize_name(name) in seen:
+                continue
+            seen.add(normalize_name(name))
+            has_record = dist.read_text("RECORD") is not None
+            results[name] = {"modified": [], "missing": [], "extra": [], "checked": 0,
+                             "has_record": has_record, "roots": set()}
+            try:
+                files = dist.files or []
+            except ValueError:
+                # RECORD 中的大小字段被改坏，整个 RECORD 已不可信
+                results[name]["modified"].append("RECORD")
+                continue
+            owned = {os.path.normpath(dist.locate_file(record)) for record in files}
+            claimed.update(owned)
+            if not has_record:
+                continue
+            base = Path(dist.locate_file(""))
+            for record in files:
+                path = os.path.normpath(dist.locate_file(record))
+                entries.append((name, str(record), path, record.hash, record.size))
+                parts = Path(str(record)).parts
+                # 只检查由本包提供 __init__.py 的顶层目录，跳过共享的命名空间目录
+                if len(parts) > 1 and parts[0] != "..":
+                    root = os.path.normpath(base / parts[0])
+                    if os.path.join(root, "__init__.py") in owned:
+                        results[name]["roots"].add(root)
+        return results, entries, claimed
+
+    def verify(self, distributions=None):
+        """校验环境中的所有发行版，返回 {包名: {"modified", "missing", "extra", "checked"}}"""
+        if distributions is None:
+            distributions = importlib.metadata.distributions()
+        results, entries, claimed = self._collect(distributions)
+
+        jobs = {}
+        pending = []
+        for name, record, path, file_hash, size in entries:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                results[name]["missing"].append(record)
+                continue
+            results[name]["checked"] += 1
+            if size is not None and stat.st_size != size:
+                results[name]["modified"].append(record)
+                continue
+            if file_hash is None:
+                continue
+            algorithm = file_hash.mode
+            if algorithm not in hashlib.algorithms_available:
+                # 哈希字段无法识别（RECORD 被手工改坏），无法校验，按已修改处理
+                results[name]["modified"].append(record)
+                continue
+            key = [stat.st_ino, stat.st_size, stat.st_mtime_ns, algorithm]
+            cached = self._cache.get(path)
+            if cached and cached[:4] == key:
+                if cached[4] != file_hash.value:
+                    results[name]["modified"].append(record)
+                continue
+            if (path, algorithm) not in jobs:
+                jobs[(path, algorithm)] = key
+            pending.append((name, record, path, algorithm, file_hash.value))
+
+        # 只哈希缓存未命中的文件，大文件通过内存映射读取
+        job_list = list(jobs)
+        if job_list:
+            # 在多线程的界面进程中使用 spawn 创建子进程，避免 fork 带来的锁状态问题
+            with ProcessPoolExecutor(max_workers=self.max_workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                digests = dict(zip(job_list, executor.map(_hash_file, job_list, chunksize=32)))
+        else:
+            digests = {}
+        for (path, algorithm), key in jobs.items():
+            if digests[(path, algorithm)] is not None:
+                self._cache[path] = key + [digests[(path, algorithm)]]
+        for name, record, path, algorithm, expected in pending:
+            if digests[(path, algorithm)] != expected:
+                results[name]["modified"].append(record)
+
+        # 包目录中未被任何已安装包声明的文件视为多余文件（忽略字节码缓存）
+        reported = set()
+        for name, result in results.items():
+            for root in sorted(result.pop("roots")):
+                if not os.path.isdir(root):
+                    continue
+                for dirpath, dirnames, filenames in os.walk(root):
+                    dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+                    for filename in filenames:
+                        path = os.path.join(dirpath, filename)
+                        if filename.endswith(".pyc") or path in claimed or path in reported:
+                            continue
+                        reported.add(path)
+                        relative = os.path.relpath(path, os.path.dirname(root))
+                        result["extra"].append(relative.replace(os.sep, "/"))
+
+        self.save_cache()
+        return results
+
+class ScanService:
+    """首个实例内的本地扫描服务
+
+    通过 Unix 域套接字（Windows 下为命名管道）向后续启动的实例和命令行
+    提供已缓存的包清单，避免每个工具各自重新执行 pip list 和大小统计。
+    连接使用仅当前用户可读的随机密钥认证。
+    """
+    def __init__(self, address=SERVICE_ADDRESS, key_path=SERVICE_KEY_PATH):
+        self.address = address
+        self.key_path = Path(key_path)
+        self.listener = None
+        self.packages = {}
+        self.scanned_at = None
+        self.pending = 0
+        self.scanning = False
+        self.on_activate = None  # 其他实例请求激活窗口时回调
+        self.on_scan = None  # 尚无清单时请求扫描的回调
+        self._scan_requested = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        authkey = os.urandom(32)
+        self.key_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(authkey)
+        if os.name != 'nt' and os.path.exists(self.address):
+            # 已持有单实例锁，残留的套接字文件来自崩溃的旧实例
+            os.unlink(self.address)
+        self.listener = Listener(self.address, authkey=authkey)
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+    def _serve(self):
+        listener = self.listener
+        while self.listener is listener:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                request = conn.recv()
+                conn.send(self.dispatch(request.get("cmd")))
+            except (OSError, EOFError, AttributeError):
+                pass
+
+    def dispatch(self, cmd):
+        if cmd == "activate":
+            if self.on_activate:
+                self.on_activate()
+            return {"ok": True}
+        if cmd == "inventory":
+            # 尚未扫描过且没有进行中的扫描时才触发，避免打断用户发起的扫描
+            with self._lock:
+                need_scan = (self.scanned_at is None and not self.scanning
+                             and self.on_scan is not None and not self._scan_requested)
+                if need_scan:
+                    self._scan_requested = True
+            if need_scan:
+                self.on_scan()
+            return self.snapshot()
+        return {"ok": False, "error": f"未知命令: {cmd}"}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "ok": True,
+                "packages": [dict(p) for p in self.packages.values()],
+                "scanned_at": self.scanned_at,
+                "scanning": self.scanning,
+                "pending": self.pending,
+                "complete": self.scanned_at is not None and not self.scanning and self.pending == 0,
+            }
+
+    def begin_scan(self):
+        """开始重新扫描，清空旧清单"""
+        with self._lock:
+            self.packages = {}
+            self.pending = 0
+            self.scanning = True
+
+    def add(self, name, version):
+        """扫描过程中逐个加入包，详细信息稍后通过 update 填充"""
+        with self._lock:
+            if name not in self.packages:
+                self.pending += 1
+            self.packages[name] = {"name": name, "version": version}
+
+    def end_scan(self):
+        with self._lock:
+            self.scanning = False
+            self.scanned_at = time.time()
+
+    def update(self, name, **fields):
+        with self._lock:
+            package = self.packages.get(name)
+            if package is None:
+                return
+            if "location" in fields and "location" not in package:
+                self.pending -= 1
+            package.update(fields)
+
+def request_service(cmd, address=SERVICE_ADDRESS, key_path=SERVICE_KEY_PATH):
+    """向已运行的实例发送请求，服务不可用时返回None"""
+    try:
+        authkey = Path(key_path).read_bytes()
+        with Client(address, authkey=authkey) as conn:
+            conn.send({"cmd": cmd})
+            return conn.recv()
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+def print_inventory(timeout=120):
+    """命令行输出包清单：优先复用运行中实例的缓存，否则本地扫描
+
+    运行中实例尚未扫描或正在扫描包列表时直接在本地扫描；列表已就绪、
+    只差详细信息时等待其补全并在stderr输出进度。返回进程退出码，
+    超时前仍未补全时返回1。
+    """
+    reply = request_service("inventory")
+    if reply is not None and (reply["scanned_at"] is None or reply["scanning"]):
+        print("运行中的实例尚未完成扫描，改为本地扫描...", file=sys.stderr)
+        reply = None
+    deadline = time.time() + timeout
+    while reply is not None and not reply["complete"] and time.time() < deadline:
+        total = len(reply["packages"])
+        print(f"等待运行中的实例获取详细信息: {total - reply['pending']}/{total}", file=sys.stderr)
+        time.sleep(1)
+        reply = request_service("inventory")
+    packages = reply["packages"] if reply is not None else scan_inventory()
+    json.dump(packages, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    if reply is not None and not reply["complete"]:
+        print(f"警告: 运行中的实例在 {timeout} 秒内未完成扫描，以上清单不完整", file=sys.stderr)
+        return 1
+    return 0
+
 class JhHzApp:
-    def __init__(self, root):
+    def __init__(self, root, service=None):
         self.root = root
+        self.service = service
         self.root.title("JhHz - Python环境管理器")
         self.root.geometry("900x700")
         self.root.resizable(True, True)
@@ -98,10 +840,29 @@ class JhHzApp:
         self.log_thread = threading.Thread(target=self.process_log_queue, daemon=True)
         self.log_thread.start()
 
-        # 创建用于获取包详细信息的队列和工作线程
+        # 创建用于获取包详细信息的队列和多个工作线程，pip show 耗时较长，并发获取
         self.details_queue = Queue()
-        self.details_worker_thread = threading.Thread(target=self.details_worker, daemon=True)
-        self.details_worker_thread.start()
+        self.details_worker_threads = [threading.Thread(target=self.details_worker, daemon=True)
+                                       for _ in range(DETAILS_WORKERS)]
+        for thread in self.details_worker_threads:
+            thread.start()
+
+        # 最近一次完整性校验结果，供详细信息窗口显示
+        self.verify_results = {}
+
+        # 流式加载状态：已插入包名的有序键，以及用于丢弃过期批次的扫描序号
+        self._tree_keys = []
+        self._scan_generation = 0
+
+        if self.service is not None:
+            self.service.on_activate = lambda: self.root.after(0, self.activate_window)
+            self.service.on_scan = lambda: self.root.after(0, self.check_installed_packages)
+
+    def activate_window(self):
+        """其他实例启动时将主窗口提到前台"""
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
         
     def setup_ui(self):
         # 主框架
@@ -150,6 +911,16 @@ class JhHzApp:
                                             command=self.check_installed_packages)
         self.check_packages_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        # 检查更新按钮
+        self.check_updates_btn = tb.Button(button_frame, text="检查更新", 
+                                           command=self.check_outdated_packages)
+        self.check_updates_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        # 文件完整性校验按钮
+        self.verify_btn = tb.Button(button_frame, text="校验完整性", 
+                                    command=self.verify_installed_files)
+        self.verify_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
         # 已安装包显示区域
         packages_status_frame = tb.LabelFrame(main_frame, text="已安装的包", padding="10")
         packages_status_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 20))
@@ -157,16 +928,20 @@ class JhHzApp:
         packages_status_frame.rowconfigure(0, weight=1)
         
         # 创建Treeview来显示已安装的包
-        self.packages_tree = tb.Treeview(packages_status_frame, columns=("version", "size", "location"), 
+        self.packages_tree = tb.Treeview(packages_status_frame, columns=("version", "latest", "size", "location"), 
                                          show="tree headings", height=8)
         self.packages_tree.heading("#0", text="包名")
         self.packages_tree.heading("version", text="版本")
+        self.packages_tree.heading("latest", text="最新版本")
         self.packages_tree.heading("size", text="大小")
         self.packages_tree.heading("location", text="安装位置")
         
         # 设置列宽
         self.packages_tree.column("#0", width=200)
         self.packages_tree.column("version", width=100)
+        self.packages_tree.column("latest", width=100)
+        self.packages_tree.tag_configure("outdated", foreground="orange")
+        self.packages_tree.tag_configure("corrupted", foreground="red")
         self.packages_tree.column("size", width=100)
         self.packages_tree.column("location", width=300)
         
@@ -284,64 +1059,63 @@ class JhHzApp:
         threading.Thread(target=check, daemon=True).start()
         
     def check_installed_packages(self):
-        """检测已安装的包，优化UI响应"""
+        """流式检测已安装的包，边扫描边按名称顺序插入列表（须在主线程调用）"""
+        self._scan_generation += 1
+        generation = self._scan_generation
+
+        # 在启动扫描线程前同步清空，旧扫描的批次会因序号过期被丢弃
+        self.packages_tree.delete(*self.packages_tree.get_children())
+        self._tree_keys = []
+        if self.service is not None:
+            self.service.begin_scan()
+
         def check():
             self.log_message("开始检测已安装的包...")
-            
-            # 使用 after 在主线程中清空UI
-            def clear_tree():
-                self.packages_tree.delete(*self.packages_tree.get_children())
-            self.root.after(0, clear_tree)
 
+            count = 0
             try:
-                pip_path = get_pip_path()
-                if pip_path:
-                    result = subprocess.run([pip_path, "list", "--format=json"],
-                                          capture_output=True, text=True, timeout=30, encoding='utf-8', errors='ignore')
-                else:
-                    # fallback
-                    result = subprocess.run([sys.executable, "-m", "pip", "list", "--format=json"],
-                                          capture_output=True, text=True, timeout=30, encoding='utf-8', errors='ignore')
-                
-                if result.returncode != 0:
-                    self.log_message(f"检测失败: {result.stderr}")
-                    self.root.after(0, messagebox.showerror, "错误", "无法获取已安装的包列表")
-                    return
-
-                packages = json.loads(result.stdout)
-                packages.sort(key=lambda x: x['name'].lower())
-                
-                self.log_message(f"检测到 {len(packages)} 个包，正在快速加载列表...")
-
-                # 先快速填充列表，详细信息后续更新
-                def populate_initial_list():
-                    for package in packages:
-                        self.packages_tree.insert("", "end", text=package['name'], 
-                                                 values=(package['version'], "获取中...", "获取中..."))
-                    self.log_message("包列表初步加载完成，正在后台获取详细信息...")
-                    # 将获取详细信息的任务放入队列
-                    self.get_packages_details()
-                
-                self.root.after(0, populate_initial_list)
+                # 分批提交到主线程，首批立即显示，之后每批最多间隔 PACKAGE_BATCH_INTERVAL 秒
+                batch = []
+                last_flush = 0.0
+                for package in iter_installed_packages():
+                    if generation != self._scan_generation:
+                        return
+                    batch.append(package)
+                    count += 1
+                    now = time.time()
+                    if len(batch) >= PACKAGE_BATCH_SIZE or now - last_flush >= PACKAGE_BATCH_INTERVAL:
+                        self.root.after(0, self._insert_packages, generation, batch)
+                        batch = []
+                        last_flush = now
+                if batch:
+                    self.root.after(0, self._insert_packages, generation, batch)
+                self.log_message(f"检测到 {count} 个包，正在后台获取详细信息...")
 
-                self.log_message(f"pip list stdout: {result.stdout}")
-                self.log_message(f"pip list stderr: {result.stderr}")
-
-            except json.JSONDecodeError as e:
-                self.log_message(f"解析包列表失败: {str(e)}")
-                self.root.after(0, messagebox.showerror, "错误", "解析包列表失败")
+            except RuntimeError as e:
+                self.log_message(f"检测失败: {str(e)}")
+                self.root.after(0, messagebox.showerror, "错误", "无法获取已安装的包列表")
             except Exception as e:
                 self.log_message(f"检测异常: {str(e)}")
                 self.root.after(0, messagebox.showerror, "错误", f"检测异常: {str(e)}")
+            finally:
+                if self.service is not None and generation == self._scan_generation:
+                    self.root.after(0, self.service.end_scan)
                 
         threading.Thread(target=check, daemon=True).start()
 
-    def get_packages_details(self):
-        """将获取包详细信息的任务添加到队列中"""
-        for item_id in self.packages_tree.get_children():
-            if self.packages_tree.exists(item_id):
-                package_name = self.packages_tree.item(item_id, "text")
-                self.details_queue.put((item_id, package_name))
+    def _insert_packages(self, generation, batch):
+        """在主线程中按名称顺序插入一批包，并排队获取详细信息"""
+        if generation != self._scan_generation:
+            return
+        for name, version in batch:
+            key = name.lower()
+            index = bisect.bisect(self._tree_keys, key)
+            self._tree_keys.insert(index, key)
+            item_id = self.packages_tree.insert("", index, text=name,
+                                                values=(version, "", "获取中...", "获取中..."))
+            self.details_queue.put((item_id, name))
+            if self.service is not None:
+                self.service.add(name, version)
 
     def details_worker(self):
         """处理获取包详细信息队列的后台工作线程"""
@@ -349,9 +1123,7 @@ class JhHzApp:
             try:
                 item_id, package_name = self.details_queue.get()
 
-                location = self.get_package_location(package_name)
-                real_path = get_package_real_path(package_name)
-                size = get_package_size(real_path) if real_path else "未知"
+                location, size = get_package_details(package_name)
 
                 # 直接调度一个简单的方法来更新UI，这是更健壮的方式
                 self.root.after(0, self._update_tree_item, item_id, location, size)
@@ -363,34 +1135,117 @@ class JhHzApp:
     def _update_tree_item(self, item_id, location, size):
         """在主线程中安全地更新Treeview中的单个项目"""
         if self.packages_tree.exists(item_id):
-            current_values = self.packages_tree.item(item_id, "values")
-            current_version = current_values[0] if current_values else ""
-            self.packages_tree.item(item_id, values=(current_version, size, location))
+            self.packages_tree.set(item_id, "size", size)
+            self.packages_tree.set(item_id, "location", location)
+            if self.service is not None:
+                self.service.update(self.packages_tree.item(item_id, "text"), size=size, location=location)
+
+    def check_outdated_packages(self):
+        """并发查询索引，在列表中显示每个包的最新版本"""
+        items = {}
+        versions = {}
+        for item_id in self.packages_tree.get_children():
+            name = self.packages_tree.item(item_id, "text")
+            items.setdefault(name, []).append(item_id)
+            versions[name] = self.packages_tree.set(item_id, "version")
+        if not items:
+            messagebox.showwarning("警告", "请先检测已安装包")
+            return
+
+        # 同步禁用按钮，避免连续点击同时运行多个查询并写同一个缓存文件
+        self.check_updates_btn.config(state="disabled")
+
+        def check():
+            self.log_message(f"开始检查更新，索引: {INDEX_URL}")
+            start = time.time()
+            try:
+                client = IndexClient()
+                outdated = 0
+                for name, latest in client.iter_latest(list(items)):
+                    for item_id in items[name]:
+                        self.root.after(0, self._update_tree_latest, item_id, latest)
+                    if latest and self._is_newer(latest, versions[name]):
+                        outdated += 1
+                self.log_message(f"检查更新完成，{outdated} 个包可更新，耗时 {time.time() - start:.1f} 秒")
+                if client.failures:
+                    self.log_message(f"✗ {client.failures} 个包查询失败，最后一次错误: {client.last_error}")
+            except Exception as e:
+                self.log_message(f"检查更新异常: {str(e)}")
+            finally:
+                self.root.after(0, self.check_updates_btn.config, {"state": "normal"})
+
+        threading.Thread(target=check, daemon=True).start()
+
+    @staticmethod
+    def _is_newer(latest, current):
+        latest_v, current_v = parse_version(latest), parse_version(current)
+        return latest_v is not None and current_v is not None and latest_v > current_v
+
+    def verify_installed_files(self):
+        """按 RECORD 校验所有已安装文件，结果在列表和详细信息中显示"""
+        # 同步禁用按钮，避免连续点击启动多个进程池
+        self.verify_btn.config(state="disabled")
+
+        def verify():
+            self.log_message("开始校验已安装文件...")
+            start = time.time()
+            try:
+                results = RecordVerifier().verify()
+            except Exception as e:
+                self.log_message(f"校验异常: {str(e)}")
+                self.root.after(0, messagebox.showerror, "错误", f"校验异常: {str(e)}")
+                return
+            finally:
+                self.root.after(0, self.verify_btn.config, {"state": "normal"})
+            self.verify_results = {normalize_name(name): result for name, result in results.items()}
+            files = sum(r["checked"] for r in results.values())
+            for name, result in sorted(results.items()):
+                if not result["has_record"]:
+                    self.log_message(f"- {name}: 没有RECORD，未校验")
+                elif result["modified"] or result["missing"] or result["extra"]:
+                    self.log_message(f"✗ {name}: 修改 {len(result['modified'])}，"
+                                     f"缺失 {len(result['missing'])}，多余 {len(result['extra'])}")
+            self.log_message(f"校验完成，共 {len(results)} 个包 {files} 个文件，耗时 {time.time() - start:.1f} 秒")
+            self.root.after(0, self._mark_corrupted_items)
+
+        threading.Thread(target=verify, daemon=True).start()
+
+    def _mark_corrupted_items(self):
+        """在主线程中标红校验未通过的包，通过的包清除标记"""
+        for item_id in self.packages_tree.get_children():
+            result = self.verify_results.get(normalize_name(self.packages_tree.item(item_id, "text")))
+            corrupted = bool(result and (result["modified"] or result["missing"] or result["extra"]))
+            self._set_item_tag(item_id, "corrupted", corrupted)
+
+    def _set_item_tag(self, item_id, tag, enabled):
+        """单独添加或移除某个标记，保留项目上的其他标记"""
+        tags = [t for t in self.packages_tree.item(item_id, "tags") if t != tag]
+        if enabled:
+            tags.append(tag)
+        self.packages_tree.item(item_id, tags=tags)
+
+    def format_verify_result(self, package_name):
+        """生成详细信息窗口中的完整性校验部分"""
+        result = self.verify_results.get(normalize_name(package_name))
+        if result is None:
+            return "\n完整性校验: 未校验\n"
+        if not result["has_record"]:
+            return "\n完整性校验: 没有RECORD，无法校验\n"
+        lines = [f"\n完整性校验: 已检查 {result['checked']} 个文件"]
+        for key, label in (("modified", "已修改"), ("missing", "缺失"), ("extra", "多余")):
+            lines.append(f"{label} ({len(result[key])}):")
+            lines.extend(f"  {path}" for path in result[key])
+        return "\n".join(lines) + "\n"
+
+    def _update_tree_latest(self, item_id, latest):
+        """在主线程中更新单个包的最新版本列"""
+        if self.packages_tree.exists(item_id):
+            current = self.packages_tree.set(item_id, "version")
+            self.packages_tree.set(item_id, "latest", latest or "未知")
+            self._set_item_tag(item_id, "outdated", bool(latest and self._is_newer(latest, current)))
+            if self.service is not None:
+                self.service.update(self.packages_tree.item(item_id, "text"), latest=latest)
 
-    def get_package_location(self, package_name):
-        """通过 pip show 获取包的安装位置(Windows优化)"""
-        try:
-            startupinfo = None
-            if os.name == 'nt':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                startupinfo.wShowWindow = subprocess.SW_HIDE
-
-            result = subprocess.run(
-                [sys.executable, "-m", "pip", "show", package_name],
-                capture_output=True, text=True, timeout=15, encoding='utf-8', errors='ignore',
-                startupinfo=startupinfo
-            )
-            
-            if result.returncode == 0:
-                for line in result.stdout.splitlines():
-                    if line.startswith('Location:'):
-                        location = line.split(':', 1)[1].strip()
-                        return str(Path(location).resolve())
-            return "未知"
-        except Exception:
-            return "未知"
-        
     def install_python(self):
         """安装Python环境"""
         def install():
@@ -493,7 +1348,7 @@ class JhHzApp:
                                       capture_output=True, text=True, timeout=10)
                 
                 if result.returncode == 0:
-                    details = result.stdout
+                    details = result.stdout + self.format_verify_result(package_name)
                     
                     # 创建详细信息窗口
                     details_window = tk.Toplevel(self.root)
@@ -532,7 +1387,7 @@ class JhHzApp:
             return
         
         package_name = self.packages_tree.item(selection[0], "text")
-        location = self.packages_tree.item(selection[0], "values")[2]  # 安装位置
+        location = self.packages_tree.set(selection[0], "location")  # 安装位置
         
         if location and location != "未知":
             try:
@@ -571,8 +1426,8 @@ class JhHzApp:
                 if result.returncode == 0:
                     self.log_message(f"✓ {package_name} 卸载成功")
                     messagebox.showinfo("成功", f"{package_name} 卸载成功")
-                    # 刷新包列表
-                    self.check_installed_packages()
+                    # 在主线程刷新包列表
+                    self.root.after(0, self.check_installed_packages)
                 else:
                     self.log_message(f"✗ {package_name} 卸载失败: {result.stderr}")
                     messagebox.showerror("错误", f"{package_name} 卸载失败")
@@ -584,16 +1439,31 @@ class JhHzApp:
         threading.Thread(target=uninstall, daemon=True).start()
 
 def main():
+    if "--inventory" in sys.argv[1:]:
+        sys.exit(print_inventory())
+
     if is_already_running():
-        messagebox.showwarning("警告", "程序已经在运行中！")
+        # 让已运行的实例显示窗口，无法联系时再提示
+        if request_service("activate") is None:
+            messagebox.showwarning("警告", "程序已经在运行中！")
         return
-        
+
+    service = ScanService()
+    try:
+        service.start()
+    except OSError:
+        service = None
+
     try:
         root = tb.Window(themename="cosmo")
-        app = JhHzApp(root)
+        app = JhHzApp(root, service=service)
         root.mainloop()
     except Exception as e:
         messagebox.showerror("错误", f"程序发生错误: {str(e)}")
+    finally:
+        if service is not None:
+            service.close()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后的程序使用进程池时需要
     main()
\ No newline at end of file
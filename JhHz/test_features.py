@@ -8,6 +8,11 @@ JhHz功能测试脚本
 import subprocess
 import sys
 import json
+import os
+import base64
+import hashlib
+import tempfile
+import importlib.metadata
 from pathlib import Path
 
 def test_pip_list():
@@ -85,6 +90,269 @@ def test_package_size_calculation():
         print(f"✗ 计算大小异常: {str(e)}")
         return False
 
+def _write_record(site, dist_info, files):
+    """按wheel规范为测试文件生成RECORD"""
+    rows = []
+    for rel in files:
+        data = (site / rel).read_bytes()
+        digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode()
+        rows.append(f"{rel},sha256={digest},{len(data)}")
+    rows.append(f"{dist_info}/RECORD,,")
+    (site / dist_info / "RECORD").write_text("\n".join(rows) + "\n")
+
+def test_version_from_filename():
+    """测试从wheel/sdist文件名解析版本号"""
+    print("测试文件名版本解析...")
+    try:
+        import main
+        cases = [
+            ("foo_bar-1.0-py3-none-any.whl", "foo-bar", "1.0"),
+            ("foo-bar-2.0.tar.gz", "Foo.Bar", "2.0"),
+            ("foo_bar-3.0b1.zip", "foo-bar", "3.0b1"),
+            ("foo-bar-1.0.egg", "foo-bar", None),
+        ]
+        for filename, project, expected in cases:
+            actual = main.version_from_filename(filename, project)
+            if actual != expected:
+                print(f"✗ {filename}: 期望 {expected}，实际 {actual}")
+                return False
+        print(f"✓ {len(cases)} 个文件名解析正确")
+        return True
+    except Exception as e:
+        print(f"✗ 测试异常: {str(e)}")
+        return False
+
+def test_local_index():
+    """测试本地目录索引的最新版本查询与缓存"""
+    print("\n测试本地索引查询...")
+    try:
+        import main
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            page = tmp / "simple" / "foo-bar" / "index.html"
+            page.parent.mkdir(parents=True)
+            links = ["foo_bar-1.0-py3-none-any.whl", "foo-bar-2.0.tar.gz", "foo_bar-3.0b1.tar.gz"]
+            html = "".join(f'<a href="{f}">{f}</a>' for f in links)
+            page.write_text(html + '<a data-yanked="" href="x">foo_bar-9.0-py3-none-any.whl</a>')
+            cache_path = tmp / "cache.json"
+
+            client = main.IndexClient(str(tmp / "simple"), cache_path=cache_path, ttl=3600)
+            if client.get_latest("Foo_Bar") != "2.0" or client.get_latest("missing") is not None:
+                print("✗ 最新版本解析错误")
+                return False
+            client.save_cache()
+
+            # 索引未变化时应沿用缓存结果（等同于304）
+            client = main.IndexClient(str(tmp / "simple"), cache_path=cache_path, ttl=0)
+            client._cache["foo-bar"]["latest"] = "cached"
+            if client.get_latest("foo-bar") != "cached":
+                print("✗ 索引未变化时没有使用缓存")
+                return False
+
+            page.write_text(html + '<a href="y">foo_bar-4.0-py3-none-any.whl</a>')
+            stat = page.stat()
+            os.utime(page, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            # TTL内不重新读取索引
+            client = main.IndexClient(str(tmp / "simple"), cache_path=cache_path, ttl=3600)
+            if client.get_latest("foo-bar") != "2.0":
+                print("✗ TTL内重新读取了索引")
+                return False
+            # TTL过期且索引变化后获取新版本
+            client = main.IndexClient(str(tmp / "simple"), cache_path=cache_path, ttl=0)
+            if client.get_latest("foo-bar") != "4.0":
+                print("✗ 索引变化后没有更新")
+                return False
+
+            # 连接失败不写入缓存，并计入失败数量
+            client = main.IndexClient("http://127.0.0.1:1/simple/", cache_path=tmp / "down.json", ttl=3600)
+            if client.get_latest("foo-bar") is not None or client.failures != 1 or client._cache:
+                print("✗ 查询失败没有被正确记录")
+                return False
+        print("✓ 本地索引查询与缓存正常")
+        return True
+    except Exception as e:
+        print(f"✗ 测试异常: {str(e)}")
+        return False
+
+def test_record_verification():
+    """测试按RECORD校验已安装文件"""
+    print("\n测试文件完整性校验...")
+    try:
+        import main
+        with tempfile.TemporaryDirectory() as tmp:
+            site = Path(tmp) / "site-packages"
+            # 常规包：一个文件被篡改，一个被删除，并多出一个文件
+            (site / "good").mkdir(parents=True)
+            (site / "good-1.0.dist-info").mkdir()
+            (site / "good-1.0.dist-info" / "METADATA").write_text("Name: good\nVersion: 1.0\n")
+            (site / "good" / "__init__.py").write_text("")
+            (site / "good" / "data.txt").write_text("b")
+            (site / "good" / "gone.py").write_text("x = 1\n")
+            _write_record(site, "good-1.0.dist-info",
+                          ["good/__init__.py", "good/data.txt", "good/gone.py", "good-1.0.dist-info/METADATA"])
+            (site / "good" / "data.txt").write_text("c")
+            (site / "good" / "gone.py").unlink()
+            (site / "good" / "new.py").write_text("")
+            (site / "good" / "__pycache__").mkdir()
+            (site / "good" / "__pycache__" / "new.cpython.pyc").write_bytes(b"")
+
+            # 共享命名空间目录，其中还有来自无RECORD旧式包的文件
+            (site / "ns" / "a").mkdir(parents=True)
+            (site / "ns" / "b").mkdir(parents=True)
+            (site / "ns" / "a" / "mod.py").write_text("")
+            (site / "ns" / "b" / "other.py").write_text("")
+            (site / "nsdist-1.0.dist-info").mkdir()
+            (site / "nsdist-1.0.dist-info" / "METADATA").write_text("Name: nsdist\nVersion: 1.0\n")
+            _write_record(site, "nsdist-1.0.dist-info", ["ns/a/mod.py", "nsdist-1.0.dist-info/METADATA"])
+            (site / "legacy-1.0.egg-info").mkdir()
+            (site / "legacy-1.0.egg-info" / "PKG-INFO").write_text("Name: legacy\nVersion: 1.0\n")
+            (site / "legacy-1.0.egg-info" / "SOURCES.txt").write_text("setup.py\nsrc/legacy/__init__.py\n")
+
+            # RECORD 被手工改坏：未知的哈希算法和无法解析的大小字段
+            (site / "bad").mkdir()
+            (site / "bad" / "__init__.py").write_text("")
+            (site / "bad-1.0.dist-info").mkdir()
+            (site / "bad-1.0.dist-info" / "METADATA").write_text("Name: bad\nVersion: 1.0\n")
+            (site / "bad-1.0.dist-info" / "RECORD").write_text("bad/__init__.py,md999=abc,0\n")
+            (site / "badsize-1.0.dist-info").mkdir()
+            (site / "badsize-1.0.dist-info" / "METADATA").write_text("Name: badsize\nVersion: 1.0\n")
+            (site / "badsize-1.0.dist-info" / "RECORD").write_text("badsize.py,,abc\n")
+
+            # 另一路径中规范化后同名的包被前面的包遮蔽，不应参与校验
+            shadow = Path(tmp) / "shadow"
+            (shadow / "BadSize-0.1.dist-info").mkdir(parents=True)
+            (shadow / "BadSize-0.1.dist-info" / "METADATA").write_text("Name: BadSize\nVersion: 0.1\n")
+            (shadow / "BadSize-0.1.dist-info" / "RECORD").write_text("gone.py,,\n")
+
+            expected = {
+                "good": (["good/data.txt"], ["good/gone.py"], ["good/new.py"], True),
+                "nsdist": ([], [], [], True),
+                "legacy": ([], [], [], False),
+                "bad": (["bad/__init__.py"], [], [], True),
+                "badsize": (["RECORD"], [], [], True),
+            }
+            verifier = main.RecordVerifier(cache_path=Path(tmp) / "verify.json", max_workers=2)
+            # 第二次运行使用 (inode, 大小, 修改时间) 缓存，结果应一致
+            for run in range(2):
+                results = verifier.verify(importlib.metadata.distributions(path=[str(site), str(shadow)]))
+                actual = {name: (r["modified"], r["missing"], r["extra"], r["has_record"])
+                          for name, r in results.items()}
+                if actual != expected:
+                    print(f"✗ 第{run + 1}次校验结果错误: {actual}")
+                    return False
+        print("✓ 已修改、缺失和多余的文件均被正确识别")
+        return True
+    except Exception as e:
+        print(f"✗ 测试异常: {str(e)}")
+        return False
+
+def test_scan_service():
+    """测试单实例锁与本地扫描服务的IPC往返"""
+    print("\n测试单实例锁与扫描服务...")
+    try:
+        import main
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            # 单实例锁：第一次获取成功，同一锁文件再次获取应失败
+            saved = main.CACHE_DIR, main.LOCK_PATH
+            main.CACHE_DIR, main.LOCK_PATH = tmp, tmp / "jhhz.lock"
+            try:
+                if main.is_already_running() or not main.is_already_running():
+                    print("✗ 单实例锁行为错误")
+                    return False
+            finally:
+                main.CACHE_DIR, main.LOCK_PATH = saved
+                if main.mutex is not None:
+                    main.mutex.close()
+                    main.mutex = None
+
+            if os.name == 'nt':
+                address = main.SERVICE_ADDRESS + "-test"
+            else:
+                address = str(tmp / "jhhz.sock")
+            key_path = tmp / "jhhz.key"
+            service = main.ScanService(address=address, key_path=key_path)
+            scans = []
+            service.on_scan = lambda: scans.append(1)
+            service.start()
+            try:
+                reply = main.request_service("inventory", address=address, key_path=key_path)
+                main.request_service("inventory", address=address, key_path=key_path)
+                if reply is None or reply["complete"] or scans != [1]:
+                    print("✗ 尚未扫描时应只请求一次扫描")
+                    return False
+
+                service.begin_scan()
+                service.add("a", "1.0")
+                service.add("b", "2.0")
+                service.end_scan()
+                service.update("a", size="1.0KB", location="/site")
+                reply = main.request_service("inventory", address=address, key_path=key_path)
+                if reply["complete"] or reply["pending"] != 1:
+                    print("✗ 详细信息未补全时不应完成")
+                    return False
+                service.update("b", size="2.0KB", location="/site")
+                reply = main.request_service("inventory", address=address, key_path=key_path)
+                names = sorted(p["name"] for p in reply["packages"])
+                if not reply["complete"] or names != ["a", "b"]:
+                    print(f"✗ 清单错误: {reply}")
+                    return False
+
+                # 错误的密钥应被拒绝
+                wrong_key = tmp / "wrong.key"
+                wrong_key.write_bytes(os.urandom(32))
+                if main.request_service("inventory", address=address, key_path=wrong_key) is not None:
+                    print("✗ 错误的密钥没有被拒绝")
+                    return False
+            finally:
+                service.close()
+            if main.request_service("inventory", address=address, key_path=key_path) is not None:
+                print("✗ 服务关闭后仍可连接")
+                return False
+        print("✓ 单实例锁与扫描服务正常")
+        return True
+    except Exception as e:
+        print(f"✗ 测试异常: {str(e)}")
+        return False
+
+def test_streaming_package_list():
+    """测试流式获取已安装包列表"""
+    print("\n测试流式包列表...")
+    try:
+        import main
+        with tempfile.TemporaryDirectory() as tmp:
+            # 规范化后同名的包只保留路径中靠前的一份
+            first, second = Path(tmp) / "first", Path(tmp) / "second"
+            for site, dist_name, version in ((first, "Foo_Bar", "2.0"), (second, "foo-bar", "1.0"),
+                                             (second, "other", "3.0")):
+                dist_info = site / f"{dist_name}-{version}.dist-info"
+                dist_info.mkdir(parents=True)
+                (dist_info / "METADATA").write_text(f"Name: {dist_name}\nVersion: {version}\n")
+            packages = sorted(main.iter_installed_packages(path=[str(first), str(second)]))
+            if packages != [("Foo_Bar", "2.0"), ("other", "3.0")]:
+                print(f"✗ 去重结果错误: {packages}")
+                return False
+
+        # 逐行解析 name==version，非零退出和超时都应报错
+        script = "import sys; print('a==1.0'); print('not a requirement'); print('B-c==2'); sys.stderr.write('warn' * 50000)"
+        packages = list(main._iter_pip_freeze(cmd=[sys.executable, "-c", script]))
+        if packages != [("a", "1.0"), ("B-c", "2")]:
+            print(f"✗ freeze解析错误: {packages}")
+            return False
+        for script, timeout in (("import sys; print('a==1'); sys.exit(3)", 30),
+                                ("import time; print('a==1', flush=True); time.sleep(30)", 1)):
+            try:
+                list(main._iter_pip_freeze(timeout=timeout, cmd=[sys.executable, "-c", script]))
+                print("✗ pip失败或超时时没有报错")
+                return False
+            except RuntimeError:
+                pass
+        print("✓ 流式包列表正常")
+        return True
+    except Exception as e:
+        print(f"✗ 测试异常: {str(e)}")
+        return False
+
 def format_size(size_bytes):
     """格式化文件大小"""
     if size_bytes == 0:
@@ -108,6 +376,11 @@ def main():
         ("pip list命令", test_pip_list),
         ("pip show命令", test_pip_show),
         ("包大小计算", test_package_size_calculation),
+        ("文件名版本解析", test_version_from_filename),
+        ("本地索引查询", test_local_index),
+        ("文件完整性校验", test_record_verification),
+        ("单实例与扫描服务", test_scan_service),
+        ("流式包列表", test_streaming_package_list),
     ]
     
     passed = 0